@@ -1,10 +1,12 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from streamlit_gsheets import GSheetsConnection
 from datetime import date
-from typing import Dict, Any
+from typing import Dict, Any, List
 import plotly.express as px
 import plotly.graph_objects as go
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuração inicial
 def init_config():
@@ -14,6 +16,85 @@ def init_config():
         initial_sidebar_state="expanded"
     )
 
+VEICULOS = ["Carro", "Moto"]
+
+# Valores em km, litros e R$ cabem com folga na precisão de float32
+COLUNAS_NUMERICAS = ("Quilometragem", "Litros", "Preço/L", "Valor Total", "Valor")
+
+# Ordem das colunas em cada planilha, usada ao anexar novas linhas
+SCHEMAS: Dict[str, List[str]] = {
+    "Consumo": ["Data", "Veículo", "Quilometragem", "Litros", "Preço/L", "Valor Total"],
+    "Manutenção": ["Data", "Veículo", "Descrição", "Valor"],
+}
+
+# Número máximo de pontos por veículo enviados aos gráficos de linha
+LTTB_PONTOS = 500
+
+def _lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Índices selecionados pelo Largest-Triangle-Three-Buckets."""
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        prox = slice(edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else slice(n - 1, n)
+        cx, cy = x[prox].mean(), y[prox].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+def _downsample(df: pd.DataFrame, y: str, n_out: int = LTTB_PONTOS) -> pd.DataFrame:
+    """Reduz cada série (por veículo, ordenada por data) a no máximo n_out pontos."""
+    partes = []
+    for _, df_veiculo in df.groupby('Veículo', sort=False, observed=True):
+        x = df_veiculo['Data'].to_numpy('datetime64[ns]').astype('int64')
+        x = (x - x[0]) / 1e9
+        idx = _lttb_indices(x, df_veiculo[y].to_numpy(dtype=float, na_value=np.nan), n_out)
+        partes.append(df_veiculo.iloc[idx])
+    return pd.concat(partes) if partes else df
+
+# Figuras em cache: px.line só é executado quando os dados mudam
+@st.cache_data(show_spinner=False)
+def _build_line_fig(df: pd.DataFrame, y: str, title: str) -> Dict[str, Any]:
+    fig = px.line(_downsample(df, y), x='Data', y=y, color='Veículo', title=title, render_mode='webgl')
+    fig.update_layout(uirevision='fuel')
+    return fig.to_dict()
+
+# Leitura em cache: evita novas chamadas à API do Google Sheets a cada rerun
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_read(worksheet: str) -> pd.DataFrame:
+    conn = st.connection("gsheets", type=GSheetsConnection)
+    df = conn.read(worksheet=worksheet, ttl=0)
+    if 'Data' in df.columns:
+        df['Data'] = _parse_dates(df['Data'])
+    if 'Veículo' in df.columns:
+        df['Veículo'] = _as_vehicle_category(df['Veículo'])
+    for col in COLUNAS_NUMERICAS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col]).astype('float32')
+    # Colunas em Arrow evitam a conversão pandas -> Arrow em cada st.dataframe
+    return df.convert_dtypes(dtype_backend='pyarrow', convert_integer=False)
+
+def _as_vehicle_category(values: pd.Series) -> pd.Series:
+    # Veículos digitados direto na planilha viram categorias extras em vez de NaN
+    if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+        values = values.str.strip()
+    extras = sorted(set(values.dropna()) - set(VEICULOS))
+    return values.astype(pd.CategoricalDtype(VEICULOS + extras))
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    # Formato ISO gravado pelo app; datas digitadas na planilha seguem dd/mm/aaaa
+    parsed = pd.to_datetime(values, format='%Y-%m-%d', cache=True, errors='coerce')
+    falhas = parsed.isna() & values.notna()
+    if falhas.any():
+        parsed[falhas] = pd.to_datetime(values[falhas], format='%d/%m/%Y', cache=True, errors='coerce')
+    return parsed
+
 # Classes para gerenciamento de dados
 class DataManager:
     def __init__(self):
@@ -21,35 +102,58 @@ class DataManager:
 
     def read_data(self, worksheet: str) -> pd.DataFrame:
         try:
-            df = self.conn.read(worksheet=worksheet, ttl=5)
-            if 'Data' in df.columns:
-                df['Data'] = pd.to_datetime(df['Data']).dt.date
-            return df
+            return _cached_read(worksheet)
         except Exception as e:
             st.error(f"Erro ao ler dados: {str(e)}")
             return pd.DataFrame()
 
+    def read_many(self, *worksheets: str) -> List[pd.DataFrame]:
+        # Só a leitura de rede roda nas threads; erros são exibidos na thread do script
+        with ThreadPoolExecutor(max_workers=len(worksheets)) as executor:
+            futures = [executor.submit(_cached_read, worksheet) for worksheet in worksheets]
+        resultados = []
+        for future in futures:
+            try:
+                resultados.append(future.result())
+            except Exception as e:
+                st.error(f"Erro ao ler dados: {str(e)}")
+                resultados.append(pd.DataFrame())
+        return resultados
+
     def add_data(self, worksheet: str, data: Dict[str, Any]) -> bool:
         try:
-            df_existing = self.read_data(worksheet)
-            df_new = pd.DataFrame([data])
-            df_updated = pd.concat([df_existing, df_new], ignore_index=True)
-            self.conn.update(worksheet=worksheet, data=df_updated)
+            # Anexa apenas a nova linha em vez de reescrever a planilha inteira
+            ws = self.conn.client._open_spreadsheet().worksheet(worksheet)
+            row = [self._to_cell(data.get(col)) for col in SCHEMAS[worksheet]]
+            ws.append_row(row, value_input_option="USER_ENTERED")
+            st.cache_data.clear()
             return True
         except Exception as e:
             st.error(f"Erro ao adicionar dados: {str(e)}")
             return False
 
+    @staticmethod
+    def _to_cell(value: Any) -> Any:
+        # date e pd.Timestamp são gravados no mesmo formato lido por _parse_dates
+        if isinstance(value, date):
+            return value.strftime('%Y-%m-%d')
+        return value
+
+@st.cache_resource
+def get_data_manager() -> DataManager:
+    return DataManager()
+
 # Componentes da UI
 class FuelConsumptionUI:
     def __init__(self, data_manager: DataManager):
         self.data_manager = data_manager
 
+    @st.fragment
     def render(self):
         st.header("Registro de Consumo de Combustível")
         col1, col2 = st.columns(2)
         with col1:
-            veiculo = st.selectbox("Veículo", ["Carro", "Moto"], key="fuel_vehicle")
+            veiculo = st.selectbox("Veículo", VEICULOS, key="fuel_vehicle")
             data_abastecimento = st.date_input("Data do Abastecimento", date.today(), key="fuel_date")
             km_atual = st.number_input("Quilometragem Atual", min_value=0.0, step=0.1, key="fuel_km")
         with col2:
@@ -87,18 +191,26 @@ class FuelConsumptionUI:
         dados_consumo = self.data_manager.read_data("Consumo")
         if not dados_consumo.empty:
             st.dataframe(
-                dados_consumo.sort_values('Data', ascending=False),
+                dados_consumo.sort_values('Data', ascending=False, kind='stable'),
                 hide_index=True,
-                use_container_width=True
+                use_container_width=True,
+                column_config={
+                    'Data': st.column_config.DateColumn('Data'),
+                    'Quilometragem': st.column_config.NumberColumn(format='%.1f km'),
+                    'Litros': st.column_config.NumberColumn(format='%.2f L'),
+                    'Preço/L': st.column_config.NumberColumn(format='R$ %.2f'),
+                    'Valor Total': st.column_config.NumberColumn(format='R$ %.2f'),
+                }
             )
 
 class MaintenanceUI:
     def __init__(self, data_manager: DataManager):
         self.data_manager = data_manager
 
+    @st.fragment
     def render(self):
         st.header("Registro de Manutenção")
-        veiculo = st.selectbox("Veículo", ["Carro", "Moto"], key="maint_vehicle")
+        veiculo = st.selectbox("Veículo", VEICULOS, key="maint_vehicle")
         descricao = st.text_area("Descrição da Manutenção", key="maint_desc")
         valor = st.number_input("Valor Gasto", min_value=0.0, step=0.01, key="maint_value")
         data = st.date_input("Data da Manutenção", date.today(), key="maint_date")
@@ -130,21 +242,27 @@ class MaintenanceUI:
         dados_manutencao = self.data_manager.read_data("Manutenção")
         if not dados_manutencao.empty:
             st.dataframe(
-                dados_manutencao.sort_values('Data', ascending=False),
+                dados_manutencao.sort_values('Data', ascending=False, kind='stable'),
                 hide_index=True,
-                use_container_width=True
+                use_container_width=True,
+                column_config={
+                    'Data': st.column_config.DateColumn('Data'),
+                    'Valor': st.column_config.NumberColumn(format='R$ %.2f'),
+                }
             )
 
 class ReportsUI:
     def __init__(self, data_manager: DataManager):
         self.data_manager = data_manager
 
+    @st.fragment
     def render(self):
         st.header("Relatórios")
-        dados_consumo = self.data_manager.read_data("Consumo")
-        dados_manutencao = self.data_manager.read_data("Manutenção")
+        dados_consumo, dados_manutencao = self.data_manager.read_many("Consumo", "Manutenção")
 
         if not dados_consumo.empty:
+            # Ordenado uma única vez; processamento e gráficos reutilizam esta ordem
+            dados_consumo = dados_consumo.sort_values(['Veículo', 'Data']).reset_index(drop=True)
             dados_processados = self._processar_dados_consumo(dados_consumo)
             self._render_fuel_statistics(dados_processados)
             self._render_fuel_charts(dados_consumo, dados_processados)
@@ -153,41 +271,39 @@ class ReportsUI:
             self._render_maintenance_statistics(dados_manutencao)
             self._render_maintenance_charts(dados_manutencao)
 
-    def _processar_dados_consumo(self, df):
-        df = df.copy()
-        df = df.sort_values(['Veículo', 'Data'])
-        resultado = []
-        for veiculo in df['Veículo'].unique():
-            df_veiculo = df[df['Veículo'] == veiculo].copy()
-            df_veiculo['km_diff'] = df_veiculo['Quilometragem'].diff()
-            df_veiculo['consumo_km_l'] = df_veiculo['km_diff'] / df_veiculo['Litros']
-            df_veiculo = df_veiculo.dropna(subset=['consumo_km_l'])
-            resultado.append(df_veiculo)
-        return pd.concat(resultado) if resultado else pd.DataFrame()
+    @staticmethod
+    @st.cache_data(show_spinner=False)
+    def _processar_dados_consumo(df):
+        # Espera df já ordenado por ['Veículo', 'Data'] (ver render); assign já
+        # retorna um novo frame, então não é preciso copiar df
+        km_diff = df.groupby('Veículo', sort=False, observed=True)['Quilometragem'].diff()
+        df = df.assign(km_diff=km_diff, consumo_km_l=km_diff / df['Litros'])
+        return df.dropna(subset=['consumo_km_l'])
 
     def _render_fuel_statistics(self, df):
         st.subheader("Estatísticas por Veículo")
-        for veiculo in df['Veículo'].unique():
-            df_veiculo = df[df['Veículo'] == veiculo]
+        agg = df.groupby('Veículo', sort=False, observed=True).agg(
+            custo=('Valor Total', 'sum'),
+            km=('km_diff', 'sum'),
+            consumo=('consumo_km_l', 'mean'),
+        )
+        for linha in agg.itertuples():
             col1, col2, col3 = st.columns(3)
             with col1:
-                custo_veiculo = df_veiculo['Valor Total'].sum()
-                st.metric(f"Custo Total com Combustível - {veiculo}", f"R$ {custo_veiculo:.2f}")
+                st.metric(f"Custo Total com Combustível - {linha.Index}", f"R$ {linha.custo:.2f}")
             with col2:
-                km_veiculo = df_veiculo['km_diff'].sum()
-                st.metric(f"Quilômetros Percorridos - {veiculo}", f"{km_veiculo:.1f} km")
+                st.metric(f"Quilômetros Percorridos - {linha.Index}", f"{linha.km:.1f} km")
             with col3:
-                consumo_medio = df_veiculo['consumo_km_l'].mean()
-                st.metric(f"Consumo Médio - {veiculo}", f"{consumo_medio:.2f} km/L")
+                st.metric(f"Consumo Médio - {linha.Index}", f"{linha.consumo:.2f} km/L")
                 
         st.subheader("Estatísticas de Consumo")
         if not df.empty:
             col1, col2 = st.columns(2)
             with col1:
-                custo_total = df['Valor Total'].sum()
+                custo_total = agg['custo'].sum()
                 st.metric("Custo Total com Combustível", f"R$ {custo_total:.2f}")
             with col2:
-                km_total = df['km_diff'].sum()
+                km_total = agg['km'].sum()
                 st.metric("Quilômetros Percorridos", f"{km_total:.1f} km")
 
     def _render_fuel_charts(self, df_original, df_processado):
@@ -195,19 +311,19 @@ class ReportsUI:
         st.subheader("Análise de Consumo")
         col1, col2 = st.columns(2)
         with col1:
-            fig1 = px.line(df_original.sort_values('Data'), x='Data', y='Litros', color='Veículo', title='Consumo de Combustível ao Longo do Tempo')
-            st.plotly_chart(fig1, use_container_width=True)
+            fig1 = go.Figure(_build_line_fig(df_original[['Data', 'Veículo', 'Litros']], 'Litros', 'Consumo de Combustível ao Longo do Tempo'))
+            st.plotly_chart(fig1, use_container_width=True, key="fuel_liters_chart")
         with col2:
             if not df_processado.empty:
-                fig2 = px.line(df_processado.sort_values('Data'), x='Data', y='consumo_km_l', color='Veículo', title='Consumo (km/L) ao Longo do Tempo')
+                fig2 = go.Figure(_build_line_fig(df_processado[['Data', 'Veículo', 'consumo_km_l']], 'consumo_km_l', 'Consumo (km/L) ao Longo do Tempo'))
                 fig2.update_layout(yaxis_title='Consumo (km/L)')
-                st.plotly_chart(fig2, use_container_width=True)
+                st.plotly_chart(fig2, use_container_width=True, key="fuel_kml_chart")
 
 
     def _render_maintenance_statistics(self, df):
         st.divider()
         st.subheader("Estatísticas de Manutenção")
-        gastos_por_veiculo = df.groupby('Veículo')['Valor'].sum()
+        gastos_por_veiculo = df.groupby('Veículo', sort=False, observed=True)['Valor'].sum()
         gasto_total = df['Valor'].sum()
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -219,8 +335,9 @@ class ReportsUI:
             with col2:
                 pass
             with col3:
-                fig = px.pie(df, values='Valor', names='Veículo', title='Distribuição de Gastos por Veículo')
-                st.plotly_chart(fig, use_container_width=False)
+                fig = go.Figure(go.Pie(values=gastos_por_veiculo.values, labels=gastos_por_veiculo.index))
+                fig.update_layout(title='Distribuição de Gastos por Veículo', uirevision='maintenance')
+                st.plotly_chart(fig, use_container_width=False, key="maint_pie")
 
 
     def _render_maintenance_charts(self, df):
@@ -232,18 +349,17 @@ class ReportsUI:
 def main():
     init_config()
     st.title("Controle de Veículos")
-    data_manager = DataManager()
-
-    tab1, tab2, tab3 = st.tabs(["Consumo de Combustível", "Manutenção", "Relatórios"])
-    with tab1:
-        fuel_ui = FuelConsumptionUI(data_manager)
-        fuel_ui.render()
-    with tab2:
-        maintenance_ui = MaintenanceUI(data_manager)
-        maintenance_ui.render()
-    with tab3:
-        reports_ui = ReportsUI(data_manager)
-        reports_ui.render()
+    data_manager = get_data_manager()
+
+    # Apenas a aba selecionada é renderizada a cada rerun
+    abas = {
+        "Consumo de Combustível": FuelConsumptionUI,
+        "Manutenção": MaintenanceUI,
+        "Relatórios": ReportsUI,
+    }
+    aba_ativa = st.radio("Visualização", list(abas), horizontal=True,
+                         label_visibility="collapsed", key="active_tab")
+    abas[aba_ativa](data_manager).render()
 
     st.markdown("---")
     st.markdown(